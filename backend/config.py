@@ -24,12 +24,32 @@ class Settings:
     GOOGLE_CLIENT_SECRET: str = os.getenv("GOOGLE_CLIENT_SECRET", "")
     GOOGLE_REDIRECT_URI: str = os.getenv("GOOGLE_REDIRECT_URI", "http://localhost:5050/auth/oauth2/callback")
 
+    # Pooled keep-alive connections to Google OAuth endpoints
+    GOOGLE_HTTP_POOL_SIZE: int = int(os.getenv("GOOGLE_HTTP_POOL_SIZE", "10"))
+    # Fallback TTL for Google ID token certs when no max-age is returned
+    GOOGLE_CERTS_CACHE_SECONDS: int = int(os.getenv("GOOGLE_CERTS_CACHE_SECONDS", "3600"))
+
     # Gmail
     GMAIL_SCOPES: str = os.getenv(
         "GMAIL_SCOPES",
         "https://www.googleapis.com/auth/gmail.readonly https://www.googleapis.com/auth/userinfo.email https://www.googleapis.com/auth/userinfo.profile openid",
     )
 
+    # Gmail resilience: per-call timeout, retries with backoff, circuit breakers
+    # and hedging (GMAIL_HEDGE_AFTER_SECONDS=0 disables hedged requests)
+    GMAIL_API_ENDPOINT: str = os.getenv("GMAIL_API_ENDPOINT", "")
+    GMAIL_TIMEOUT_SECONDS: float = float(os.getenv("GMAIL_TIMEOUT_SECONDS", "10"))
+    GMAIL_MAX_RETRIES: int = int(os.getenv("GMAIL_MAX_RETRIES", "3"))
+    GMAIL_BACKOFF_BASE_SECONDS: float = float(os.getenv("GMAIL_BACKOFF_BASE_SECONDS", "0.5"))
+    GMAIL_BACKOFF_MAX_SECONDS: float = float(os.getenv("GMAIL_BACKOFF_MAX_SECONDS", "8"))
+    GMAIL_USER_BREAKER_FAILURES: int = int(os.getenv("GMAIL_USER_BREAKER_FAILURES", "5"))
+    GMAIL_GLOBAL_BREAKER_FAILURES: int = int(os.getenv("GMAIL_GLOBAL_BREAKER_FAILURES", "20"))
+    GMAIL_BREAKER_RESET_SECONDS: float = float(os.getenv("GMAIL_BREAKER_RESET_SECONDS", "30"))
+    GMAIL_HEDGE_AFTER_SECONDS: float = float(os.getenv("GMAIL_HEDGE_AFTER_SECONDS", "0"))
+    GMAIL_HEDGE_WORKERS: int = int(os.getenv("GMAIL_HEDGE_WORKERS", "8"))
+    # Oldest cached listing served (marked stale) while Gmail is unavailable
+    GMAIL_STALE_MAX_SECONDS: int = int(os.getenv("GMAIL_STALE_MAX_SECONDS", "3600"))
+
     # Frontend
     FRONTEND_APP_URL: str = os.getenv("FRONTEND_APP_URL", "http://localhost:5173")
 
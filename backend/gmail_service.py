@@ -1,34 +1,126 @@
-from typing import List
+import json
+from collections import deque
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, Optional
 from datetime import datetime, timedelta
-from googleapiclient.discovery import build
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
 
+from . import resilience
+from .config import settings
+from .google_oauth import refresh_credentials
 from .models import Email
 
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
+
+
+@lru_cache(maxsize=None)
+def _gmail_discovery_doc() -> Optional[dict]:
+    """Parse the Gmail v1 discovery document shipped with google-api-python-client.
+
+    Parsed once per process and reused for every GmailService, so building a
+    client neither fetches the document over the network nor re-parses it.
+    """
+    from googleapiclient.discovery_cache import get_static_doc
+
+    doc = get_static_doc("gmail", "v1")
+    return json.loads(doc) if doc else None
+
 
 class GmailService:
     """Gmail API service using stored OAuth2 credentials"""
 
-    def __init__(self, credentials: Credentials):
-        self.creds = credentials
-        if self.creds and self.creds.expired and self.creds.refresh_token:
-            self.creds.refresh(Request())
-        self.service = build("gmail", "v1", credentials=self.creds, cache_discovery=False)
+    # Keep-alive clients kept for hedged attempts: one for the primary and one
+    # for its hedge is enough for the sequential calls a service makes.
+    MAX_IDLE_HTTP = 2
+
+    def __init__(self, credentials: "Credentials", user_key: Optional[str] = None):
+        from googleapiclient.discovery import build, build_from_document
+
+        self.creds = refresh_credentials(credentials)
+        self.breaker = resilience.get_breaker(user_key) if user_key else None
+        self._idle_http = deque()
+
+        client_options = {"api_endpoint": settings.GMAIL_API_ENDPOINT} if settings.GMAIL_API_ENDPOINT else None
+        discovery_doc = _gmail_discovery_doc()
+        if discovery_doc is not None:
+            self.service = build_from_document(discovery_doc, http=self._new_http(), client_options=client_options)
+        else:
+            self.service = build(
+                "gmail", "v1", http=self._new_http(), client_options=client_options, cache_discovery=False
+            )
+
+    def _new_http(self):
+        """Authorized httplib2 client with the per-call Gmail timeout."""
+        import httplib2
+        from google_auth_httplib2 import AuthorizedHttp
+
+        return AuthorizedHttp(self.creds, http=httplib2.Http(timeout=settings.GMAIL_TIMEOUT_SECONDS))
+
+    def _checkout_http(self):
+        """Reuse an idle keep-alive client for a hedged attempt, or open a new one."""
+        while self._idle_http:
+            http = self._idle_http.pop()
+            if not getattr(http, "cancelled", False):
+                return http
+        return self._new_http()
+
+    def _checkin_http(self, http) -> None:
+        # A cancelled client has a dead socket and refuses to reconnect
+        if not getattr(http, "cancelled", False) and len(self._idle_http) < self.MAX_IDLE_HTTP:
+            self._idle_http.append(http)
+
+    @staticmethod
+    def _cancel_http(authed_http) -> None:
+        """Abort an in-flight request on a client from _checkout_http().
+
+        Shutting the socket down wakes the blocked read; blocking reconnects
+        stops httplib2 from transparently resending the request. The client
+        is marked so it is never reused.
+        """
+        import socket
+
+        def refuse_reconnect():
+            raise ConnectionAbortedError("Gmail request cancelled")
+
+        authed_http.cancelled = True
+        for conn in list(authed_http.http.connections.values()):
+            conn.connect = refuse_reconnect
+            if conn.sock is not None:
+                try:
+                    conn.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def _send(self, request, http=None) -> dict:
+        if http is None:
+            return request.execute()
+        try:
+            return request.execute(http=http)
+        finally:
+            self._checkin_http(http)
+
+    def _execute(self, request) -> dict:
+        # httplib2 clients are not thread-safe, so a hedge never shares the
+        # primary's client; both come from the idle pool and are returned to it
+        return resilience.call(
+            lambda http=None: self._send(request, http),
+            self.breaker,
+            new_http=self._checkout_http,
+            cancel=self._cancel_http,
+        )
 
     def _list_messages(self, query: str) -> List[dict]:
         user_id = "me"
-        response = self.service.users().messages().list(userId=user_id, q=query, maxResults=25).execute()
+        response = self._execute(self.service.users().messages().list(userId=user_id, q=query, maxResults=25))
         messages = response.get("messages", [])
         return messages
 
     def _get_message(self, msg_id: str) -> dict:
         user_id = "me"
-        msg = (
+        msg = self._execute(
             self.service.users()
             .messages()
             .get(userId=user_id, id=msg_id, format="metadata", metadataHeaders=["Subject", "From", "Date"])
-            .execute()
         )
         return msg
 
@@ -75,7 +167,7 @@ class GmailService:
 
     def get_email_by_id(self, email_id: str) -> dict:
         user_id = "me"
-        msg = self.service.users().messages().get(userId=user_id, id=email_id, format="full").execute()
+        msg = self._execute(self.service.users().messages().get(userId=user_id, id=email_id, format="full"))
         return msg
 
     def sync_emails(self) -> dict:
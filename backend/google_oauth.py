@@ -1,11 +1,25 @@
-from typing import Tuple, Dict, Any
-from google_auth_oauthlib.flow import Flow
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
-import requests
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import TYPE_CHECKING, Tuple, Dict, Any, Optional
 
 from .config import settings
 
+# Google client libraries are slow to import; they are loaded on first use so
+# that importing the app (worker boot, test collection) stays cheap.
+if TYPE_CHECKING:
+    import requests
+    from google_auth_oauthlib.flow import Flow
+    from google.oauth2.credentials import Credentials
+
+GOOGLE_TOKEN_URI = "https://oauth2.googleapis.com/token"
+GOOGLE_CERTS_URI = "https://www.googleapis.com/oauth2/v1/certs"
+GOOGLE_USERINFO_URI = "https://www.googleapis.com/oauth2/v3/userinfo"
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+
 
 def _client_config() -> Dict[str, Any]:
     return {
@@ -13,7 +27,7 @@ def _client_config() -> Dict[str, Any]:
             "client_id": settings.GOOGLE_CLIENT_ID,
             "project_id": "trackmate",
             "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-            "token_uri": "https://oauth2.googleapis.com/token",
+            "token_uri": GOOGLE_TOKEN_URI,
             "client_secret": settings.GOOGLE_CLIENT_SECRET,
             "redirect_uris": [settings.GOOGLE_REDIRECT_URI],
             "javascript_origins": settings.CORS_ORIGINS.split(","),
@@ -21,11 +35,35 @@ def _client_config() -> Dict[str, Any]:
     }
 
 
-def build_auth_url(state: str) -> str:
+@lru_cache(maxsize=1)
+def _http_session() -> "requests.Session":
+    """Process-wide keep-alive session for calls to Google's OAuth endpoints."""
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=settings.GOOGLE_HTTP_POOL_SIZE,
+        pool_maxsize=settings.GOOGLE_HTTP_POOL_SIZE,
+    )
+    session.mount("https://", adapter)
+    return session
+
+
+def _auth_flow() -> "Flow":
+    # Built per request: authorization_url() stores the state and PKCE code
+    # verifier on the Flow, so a shared instance would race between threads.
+    from google_auth_oauthlib.flow import Flow
+
     flow = Flow.from_client_config(
         _client_config(), scopes=settings.GMAIL_SCOPES.split()
     )
     flow.redirect_uri = settings.GOOGLE_REDIRECT_URI
+    return flow
+
+
+def build_auth_url(state: str) -> str:
+    flow = _auth_flow()
     auth_url, _ = flow.authorization_url(
         access_type="offline",
         include_granted_scopes="false",
@@ -35,26 +73,109 @@ def build_auth_url(state: str) -> str:
     return auth_url
 
 
-def exchange_code_for_tokens(code: str) -> Credentials:
-    flow = Flow.from_client_config(
-        _client_config(), scopes=settings.GMAIL_SCOPES.split()
+def exchange_code_for_tokens(code: str) -> "Credentials":
+    """Exchange an authorization code for Credentials over the pooled session."""
+    from google.oauth2.credentials import Credentials
+
+    resp = _http_session().post(
+        GOOGLE_TOKEN_URI,
+        data={
+            "code": code,
+            "client_id": settings.GOOGLE_CLIENT_ID,
+            "client_secret": settings.GOOGLE_CLIENT_SECRET,
+            "redirect_uri": settings.GOOGLE_REDIRECT_URI,
+            "grant_type": "authorization_code",
+        },
+        timeout=10,
+    )
+    is_json = resp.headers.get("Content-Type", "").startswith("application/json")
+    if not resp.ok:
+        try:
+            payload = resp.json() if is_json else {}
+        except ValueError:
+            payload = {}
+        detail = payload.get("error_description") or payload.get("error") or f"{resp.status_code} {resp.reason}"
+        raise Exception(f"Token exchange failed: {detail}")
+    if not is_json:
+        raise Exception("Token exchange failed: unexpected non-JSON response")
+    payload = resp.json()
+
+    expires_in = payload.get("expires_in")
+    scope = payload.get("scope")
+    return Credentials(
+        token=payload.get("access_token"),
+        refresh_token=payload.get("refresh_token"),
+        id_token=payload.get("id_token"),
+        token_uri=GOOGLE_TOKEN_URI,
+        client_id=settings.GOOGLE_CLIENT_ID,
+        client_secret=settings.GOOGLE_CLIENT_SECRET,
+        scopes=scope.split() if scope else settings.GMAIL_SCOPES.split(),
+        expiry=datetime.utcnow() + timedelta(seconds=int(expires_in)) if expires_in else None,
+    )
+
+
+def build_credentials(access_token: str, refresh_token: Optional[str]) -> "Credentials":
+    """Rebuild Credentials from tokens stored for a user."""
+    from google.oauth2.credentials import Credentials
+
+    return Credentials(
+        token=access_token,
+        refresh_token=refresh_token,
+        client_id=settings.GOOGLE_CLIENT_ID,
+        client_secret=settings.GOOGLE_CLIENT_SECRET,
+        token_uri=GOOGLE_TOKEN_URI,
     )
-    flow.redirect_uri = settings.GOOGLE_REDIRECT_URI
-    flow.fetch_token(code=code)
-    return flow.credentials  # contains refresh_token, id_token, etc.
 
 
-def refresh_credentials(creds: Credentials) -> Credentials:
+def refresh_credentials(creds: "Credentials") -> "Credentials":
     if creds and creds.expired and creds.refresh_token:
-        creds.refresh(Request())
+        from google.auth.transport.requests import Request
+
+        creds.refresh(Request(session=_http_session()))
     return creds
 
 
+_certs_lock = threading.Lock()
+_certs_cache: Tuple[float, Dict[str, str]] = (0.0, {})
+
+
+def _google_certs() -> Dict[str, str]:
+    """Return Google's ID token signing certs, cached per their Cache-Control max-age."""
+    global _certs_cache
+    with _certs_lock:
+        expires_at, certs = _certs_cache
+        if certs and time.monotonic() < expires_at:
+            return certs
+
+        resp = _http_session().get(GOOGLE_CERTS_URI, timeout=10)
+        resp.raise_for_status()
+        certs = resp.json()
+        match = re.search(r"max-age=(\d+)", resp.headers.get("Cache-Control", ""))
+        max_age = int(match.group(1)) if match else settings.GOOGLE_CERTS_CACHE_SECONDS
+        _certs_cache = (time.monotonic() + max_age, certs)
+        return certs
+
+
+def verify_id_token(token: str) -> Dict[str, Any]:
+    """Verify a Google ID token locally against the cached signing certs."""
+    from google.auth import jwt as google_jwt
+
+    claims = google_jwt.decode(
+        token,
+        certs=_google_certs(),
+        audience=settings.GOOGLE_CLIENT_ID,
+        clock_skew_in_seconds=10,
+    )
+    if claims.get("iss") not in GOOGLE_ISSUERS:
+        raise ValueError(f"Wrong issuer: {claims.get('iss')}")
+    return claims
+
+
 def get_userinfo(access_token: str) -> Dict[str, Any]:
     """Fetch profile from Google UserInfo endpoint using the OAuth access token."""
     try:
-        resp = requests.get(
-            "https://www.googleapis.com/oauth2/v3/userinfo",
+        resp = _http_session().get(
+            GOOGLE_USERINFO_URI,
             headers={"Authorization": f"Bearer {access_token}"},
             timeout=10,
         )
@@ -62,3 +183,46 @@ def get_userinfo(access_token: str) -> Dict[str, Any]:
         return resp.json()
     except Exception:
         return {}
+
+
+def get_profile(creds: "Credentials") -> Dict[str, Any]:
+    """Profile claims for a freshly exchanged login.
+
+    Uses the returned id_token when it verifies, which avoids a round trip to
+    the UserInfo endpoint; falls back to UserInfo otherwise.
+    """
+    if creds.id_token:
+        try:
+            return verify_id_token(creds.id_token)
+        except Exception:
+            pass
+    return get_userinfo(creds.token)
+
+
+class LatencyMetrics:
+    """Rolling window of per-stage latencies (milliseconds)."""
+
+    def __init__(self, window: int = 500):
+        self._lock = threading.Lock()
+        self._window = window
+        self._samples: Dict[str, deque] = {}
+
+    def record(self, stage: str, elapsed_ms: float) -> None:
+        with self._lock:
+            self._samples.setdefault(stage, deque(maxlen=self._window)).append(elapsed_ms)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            samples = {stage: sorted(values) for stage, values in self._samples.items()}
+        summary = {}
+        for stage, values in samples.items():
+            summary[stage] = {
+                "count": len(values),
+                "p50": round(values[int(0.50 * (len(values) - 1))], 2),
+                "p95": round(values[int(0.95 * (len(values) - 1))], 2),
+                "max": round(values[-1], 2),
+            }
+        return summary
+
+
+login_metrics = LatencyMetrics()
@@ -1,11 +1,13 @@
-from fastapi import FastAPI, HTTPException, Depends, status, Request
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.responses import RedirectResponse
 import sqlite3
 import json
-from datetime import datetime, timedelta
-from typing import List, Optional
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Tuple
 import uuid
 
 from .models import (
@@ -14,19 +16,11 @@ from .models import (
 )
 from .auth import verify_token, create_access_token
 from .gmail_service import GmailService
+from .resilience import CircuitOpenError, is_retryable
 from .config import settings
-from .google_oauth import build_auth_url, exchange_code_for_tokens, get_userinfo
+from .google_oauth import build_auth_url, build_credentials, exchange_code_for_tokens, get_profile, login_metrics
 
-app = FastAPI(title="TrackMate API", version="1.0.0")
-
-# CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[o.strip() for o in settings.CORS_ORIGINS.split(",") if o.strip()],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+router = APIRouter()
 
 security = HTTPBearer()
 
@@ -69,16 +63,43 @@ def init_db():
     conn.commit()
     conn.close()
 
-init_db()
 
-@app.get("/", include_in_schema=False)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run one-time initialization when the server starts, not at import."""
+    init_db()
+    yield
+
+
+def create_app() -> FastAPI:
+    """Application factory: build the FastAPI app with middleware and routes."""
+    app = FastAPI(title="TrackMate API", version="1.0.0", lifespan=lifespan)
+
+    # CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=[o.strip() for o in settings.CORS_ORIGINS.split(",") if o.strip()],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    app.include_router(router)
+    return app
+
+@router.get("/", include_in_schema=False)
 def root():
     return RedirectResponse(url="/docs")
 
-@app.get("/health", include_in_schema=False)
+@router.get("/health", include_in_schema=False)
 def health():
     return {"status": "ok"}
 
+@router.get("/metrics/login", include_in_schema=False)
+def login_latency():
+    """Rolling login latency percentiles (ms) per stage."""
+    return login_metrics.snapshot()
+
 # Dependency to get current user
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
@@ -107,7 +128,7 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         raise HTTPException(status_code=401, detail="Invalid token")
 
 # Authentication routes
-@app.get("/api/auth/google/url")
+@router.get("/api/auth/google/url")
 async def google_auth_url(request: Request):
     """Return the Google OAuth2 authorization URL for the frontend to redirect to."""
     # Optional: include a CSRF state you manage via cookie/session
@@ -116,14 +137,19 @@ async def google_auth_url(request: Request):
     return {"authUrl": auth_url, "state": state}
 
 
-@app.post("/api/auth/google/login", response_model=LoginResponse)
-async def google_login(request: LoginRequest):
+# Login routes are sync so concurrent sign-ins run in the threadpool, not the event loop
+@router.post("/api/auth/google/login", response_model=LoginResponse)
+def google_login(request: LoginRequest):
     """Exchange OAuth2 code for tokens, persist user, and return app JWT."""
+    started = time.perf_counter()
     try:
         creds = exchange_code_for_tokens(request.code)
+        exchanged = time.perf_counter()
+        login_metrics.record("token_exchange", (exchanged - started) * 1000)
 
-        # Extract profile info from Google using the OAuth access token
-        id_info = get_userinfo(creds.token)
+        # Profile from the verified id_token, falling back to UserInfo
+        id_info = get_profile(creds)
+        login_metrics.record("profile", (time.perf_counter() - exchanged) * 1000)
 
         google_id = id_info.get("sub") or ""
         email = id_info.get("email") or ""
@@ -174,10 +200,12 @@ async def google_login(request: LoginRequest):
         )
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        login_metrics.record("total", (time.perf_counter() - started) * 1000)
 
 
-@app.get("/api/auth/google/callback")
-async def google_callback(code: Optional[str] = None, state: Optional[str] = None, format: Optional[str] = None):
+@router.get("/api/auth/google/callback")
+def google_callback(code: Optional[str] = None, state: Optional[str] = None, format: Optional[str] = None):
     """OAuth2 callback endpoint. Exchanges code and returns app token + user.
 
     - If `format=json`, returns JSON body (handy for Swagger).
@@ -186,7 +214,7 @@ async def google_callback(code: Optional[str] = None, state: Optional[str] = Non
     if not code:
         raise HTTPException(status_code=400, detail="Missing authorization code")
 
-    login_resp: LoginResponse = await google_login(LoginRequest(code=code))
+    login_resp: LoginResponse = google_login(LoginRequest(code=code))
 
     if format == "json":
         return login_resp.model_dump(by_alias=True)
@@ -195,65 +223,86 @@ async def google_callback(code: Optional[str] = None, state: Optional[str] = Non
     redirect_url = f"{settings.FRONTEND_APP_URL}/auth/callback#token={login_resp.access_token}"
     return RedirectResponse(url=redirect_url)
 
-@app.get("/api/auth/me", response_model=User)
+@router.get("/api/auth/me", response_model=User)
 async def get_me(current_user: User = Depends(get_current_user)):
     return current_user
 
 # Email routes
-@app.get("/api/emails/unread", response_model=List[Email])
-async def get_unread_emails(current_user: User = Depends(get_current_user)):
-    """Get unread emails from last 24 hours"""
-    # Load user's OAuth creds
+def _load_user_credentials(user_id: str):
+    """Load the stored Google OAuth tokens for a user as Credentials."""
     conn = sqlite3.connect('trackmate.db')
     cursor = conn.cursor()
-    cursor.execute("SELECT access_token, refresh_token FROM users WHERE id = ?", (current_user.id,))
+    cursor.execute("SELECT access_token, refresh_token FROM users WHERE id = ?", (user_id,))
     row = cursor.fetchone()
     conn.close()
     if not row:
         raise HTTPException(status_code=401, detail="User credentials not found")
 
     access_token, refresh_token = row
-    from google.oauth2.credentials import Credentials
-    creds = Credentials(token=access_token, refresh_token=refresh_token, client_id=settings.GOOGLE_CLIENT_ID, client_secret=settings.GOOGLE_CLIENT_SECRET, token_uri="https://oauth2.googleapis.com/token")
-    gmail_service = GmailService(creds)
-    return [e.model_dump(by_alias=True) for e in gmail_service.get_unread_emails_24h()]
+    return build_credentials(access_token, refresh_token)
 
-@app.get("/api/emails/requires-attention", response_model=List[Email])
-async def get_requires_attention_emails(current_user: User = Depends(get_current_user)):
-    """Get emails with 'Requires Attention' label"""
-    conn = sqlite3.connect('trackmate.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT access_token, refresh_token FROM users WHERE id = ?", (current_user.id,))
-    row = cursor.fetchone()
-    conn.close()
-    if not row:
-        raise HTTPException(status_code=401, detail="User credentials not found")
+# Last successful listing per (user, listing), served while Gmail is unavailable
+_last_listings: Dict[Tuple[str, str], Tuple[datetime, list]] = {}
 
-    access_token, refresh_token = row
-    from google.oauth2.credentials import Credentials
-    creds = Credentials(token=access_token, refresh_token=refresh_token, client_id=settings.GOOGLE_CLIENT_ID, client_secret=settings.GOOGLE_CLIENT_SECRET, token_uri="https://oauth2.googleapis.com/token")
-    gmail_service = GmailService(creds)
-    return [e.model_dump(by_alias=True) for e in gmail_service.get_requires_attention_emails()]
+def _gmail_unavailable(e: Exception) -> bool:
+    return isinstance(e, CircuitOpenError) or is_retryable(e)
 
-@app.get("/api/emails/{email_id}")
-async def get_email_details(email_id: str, current_user: User = Depends(get_current_user)):
-    """Get detailed email content"""
-    conn = sqlite3.connect('trackmate.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT access_token, refresh_token FROM users WHERE id = ?", (current_user.id,))
-    row = cursor.fetchone()
-    conn.close()
-    if not row:
-        raise HTTPException(status_code=401, detail="User credentials not found")
+def _remember_listing(user_id: str, listing: str, emails: list) -> None:
+    now = datetime.now(timezone.utc)
+    max_age = timedelta(seconds=settings.GMAIL_STALE_MAX_SECONDS)
+    for key, (fetched_at, _) in list(_last_listings.items()):
+        if now - fetched_at > max_age:
+            _last_listings.pop(key, None)
+    _last_listings[(user_id, listing)] = (now, emails)
 
-    access_token, refresh_token = row
-    from google.oauth2.credentials import Credentials
-    creds = Credentials(token=access_token, refresh_token=refresh_token, client_id=settings.GOOGLE_CLIENT_ID, client_secret=settings.GOOGLE_CLIENT_SECRET, token_uri="https://oauth2.googleapis.com/token")
-    gmail_service = GmailService(creds)
-    return gmail_service.get_email_by_id(email_id)
+def _serve_listing(user_id: str, listing: str, fetch: Callable[[GmailService], List[Email]], response: Response):
+    """Fetch a listing from Gmail, falling back to the last-known one marked stale."""
+    try:
+        gmail_service = GmailService(_load_user_credentials(user_id), user_key=user_id)
+        emails = [e.model_dump(by_alias=True) for e in fetch(gmail_service)]
+    except HTTPException:
+        raise
+    except Exception as e:
+        if not _gmail_unavailable(e):
+            raise
+        cached = _last_listings.get((user_id, listing))
+        if cached is None or datetime.now(timezone.utc) - cached[0] > timedelta(seconds=settings.GMAIL_STALE_MAX_SECONDS):
+            raise HTTPException(status_code=503, detail="Gmail is temporarily unavailable")
+        fetched_at, emails = cached
+        response.headers["X-Data-Stale"] = "true"
+        response.headers["X-Data-Fetched-At"] = fetched_at.isoformat()
+        response.headers["Warning"] = '110 - "Response is Stale"'
+        return emails
+
+    _remember_listing(user_id, listing, emails)
+    return emails
+
+# Email routes are sync so slow Gmail calls run in the threadpool, not the event loop
+@router.get("/api/emails/unread", response_model=List[Email])
+def get_unread_emails(response: Response, current_user: User = Depends(get_current_user)):
+    """Get unread emails from last 24 hours"""
+    return _serve_listing(current_user.id, "unread", GmailService.get_unread_emails_24h, response)
+
+@router.get("/api/emails/requires-attention", response_model=List[Email])
+def get_requires_attention_emails(response: Response, current_user: User = Depends(get_current_user)):
+    """Get emails with 'Requires Attention' label"""
+    return _serve_listing(current_user.id, "requires-attention", GmailService.get_requires_attention_emails, response)
+
+@router.get("/api/emails/{email_id}")
+def get_email_details(email_id: str, current_user: User = Depends(get_current_user)):
+    """Get detailed email content"""
+    try:
+        gmail_service = GmailService(_load_user_credentials(current_user.id), user_key=current_user.id)
+        return gmail_service.get_email_by_id(email_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        if not _gmail_unavailable(e):
+            raise
+        raise HTTPException(status_code=503, detail="Gmail is temporarily unavailable")
 
 # Job application routes
-@app.get("/api/jobs", response_model=List[JobApplication])
+@router.get("/api/jobs", response_model=List[JobApplication])
 async def get_job_applications(current_user: User = Depends(get_current_user)):
     """Get all job applications for current user"""
     conn = sqlite3.connect('trackmate.db')
@@ -276,7 +325,7 @@ async def get_job_applications(current_user: User = Depends(get_current_user)):
         ) for job in jobs
     ]
 
-@app.post("/api/jobs", response_model=JobApplication)
+@router.post("/api/jobs", response_model=JobApplication)
 async def create_job_application(
     request: CreateJobRequest, 
     current_user: User = Depends(get_current_user)
@@ -308,7 +357,7 @@ async def create_job_application(
         notes=request.notes
     )
 
-@app.put("/api/jobs/{job_id}", response_model=JobApplication)
+@router.put("/api/jobs/{job_id}", response_model=JobApplication)
 async def update_job_application(
     job_id: str,
     request: UpdateJobRequest,
@@ -370,7 +419,7 @@ async def update_job_application(
         notes=job[8]
     )
 
-@app.delete("/api/jobs/{job_id}")
+@router.delete("/api/jobs/{job_id}")
 async def delete_job_application(job_id: str, current_user: User = Depends(get_current_user)):
     """Delete job application"""
     conn = sqlite3.connect('trackmate.db')
@@ -385,6 +434,8 @@ async def delete_job_application(job_id: str, current_user: User = Depends(get_c
     conn.close()
     return {"message": "Job application deleted successfully"}
 
+app = create_app()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,289 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from typing import Callable, Dict, Optional, TypeVar
+
+from .config import settings
+
+T = TypeVar("T")
+H = TypeVar("H")
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling Gmail while a circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    closed -> open after `failure_threshold` failures in a row; open ->
+    half_open once `reset_timeout` seconds have passed, letting one trial call
+    through; that call closes the breaker on success or re-opens it on failure.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def release(self) -> None:
+        """Give back a trial slot taken by allow() without making the call."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+global_breaker = CircuitBreaker(
+    "global",
+    failure_threshold=settings.GMAIL_GLOBAL_BREAKER_FAILURES,
+    reset_timeout=settings.GMAIL_BREAKER_RESET_SECONDS,
+)
+
+_user_breakers: Dict[str, CircuitBreaker] = {}
+_user_breakers_lock = threading.Lock()
+
+
+def get_breaker(user_key: str) -> CircuitBreaker:
+    with _user_breakers_lock:
+        breaker = _user_breakers.get(user_key)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                f"user:{user_key}",
+                failure_threshold=settings.GMAIL_USER_BREAKER_FAILURES,
+                reset_timeout=settings.GMAIL_BREAKER_RESET_SECONDS,
+            )
+            _user_breakers[user_key] = breaker
+        return breaker
+
+
+def _status_of(exc: Exception) -> Optional[int]:
+    resp = getattr(exc, "resp", None)
+    status = getattr(resp, "status", None)
+    return int(status) if status is not None else None
+
+
+def is_quota_error(exc: Exception) -> bool:
+    """Per-user throttling: 429, or Gmail's 403 (user)rateLimitExceeded."""
+    status = _status_of(exc)
+    if status == 429:
+        return True
+    return status == 403 and b"ratelimitexceeded" in (getattr(exc, "content", b"") or b"").lower()
+
+
+def is_retryable(exc: Exception) -> bool:
+    """Transient failures: throttling, 5xx, timeouts and dropped connections."""
+    if is_quota_error(exc):
+        return True
+    status = _status_of(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUSES
+
+    import httplib2
+
+    return isinstance(exc, (OSError, httplib2.ServerNotFoundError))
+
+
+def retry_after_seconds(exc: Exception) -> Optional[float]:
+    """Parse a Retry-After header (delta-seconds or HTTP-date) off an HttpError."""
+    resp = getattr(exc, "resp", None)
+    value = resp.get("retry-after") if hasattr(resp, "get") else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Exponential backoff with full jitter, never shorter than Retry-After.
+
+    Callers should not retry at all when Retry-After exceeds
+    GMAIL_BACKOFF_MAX_SECONDS (see `call`), so it is never shortened here.
+    """
+    cap = min(settings.GMAIL_BACKOFF_MAX_SECONDS, settings.GMAIL_BACKOFF_BASE_SECONDS * (2 ** attempt))
+    delay = random.uniform(0, cap)
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+# Each hedge holds one slot from scheduling until its request finishes; when
+# none are free the call simply runs unhedged, so hedges never queue.
+_hedge_slots = threading.BoundedSemaphore(settings.GMAIL_HEDGE_WORKERS)
+
+
+@lru_cache(maxsize=1)
+def _hedge_pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=settings.GMAIL_HEDGE_WORKERS, thread_name_prefix="gmail-hedge")
+
+
+def _send_hedged(
+    send: Callable[[Optional[H]], T],
+    new_http: Callable[[], H],
+    cancel: Callable[[H], None],
+    hedge_after: float,
+) -> T:
+    """Run `send` on the calling thread, racing a copy if it is still running after `hedge_after`.
+
+    Whichever copy finishes second is cancelled so it does not hold a
+    connection or a hedge slot until its socket times out.
+    """
+    if not _hedge_slots.acquire(blocking=False):
+        return send(None)
+
+    primary_http = new_http()
+    lock = threading.Lock()
+    primary_done = threading.Event()
+    hedge = {"http": None, "value": None, "ok": False}
+
+    def run_hedge() -> None:
+        try:
+            if primary_done.wait(hedge_after):
+                return
+            http = new_http()
+            with lock:
+                if primary_done.is_set():
+                    return
+                hedge["http"] = http
+            value = send(http)
+            with lock:
+                hedge["value"], hedge["ok"] = value, True
+                if not primary_done.is_set():
+                    cancel(primary_http)
+        except Exception:
+            pass
+        finally:
+            _hedge_slots.release()
+
+    future = _hedge_pool().submit(run_hedge)
+    try:
+        result = send(primary_http)
+    except Exception:
+        with lock:
+            primary_done.set()
+            hedge_started = hedge["http"] is not None
+        if hedge_started:
+            # The hedge either won and cancelled us, or may still succeed
+            future.result()
+            if hedge["ok"]:
+                return hedge["value"]
+        raise
+
+    with lock:
+        primary_done.set()
+        if hedge["http"] is not None and not hedge["ok"]:
+            cancel(hedge["http"])
+    return result
+
+
+def call(
+    send: Callable[[Optional[H]], T],
+    user_breaker: Optional[CircuitBreaker] = None,
+    new_http: Optional[Callable[[], H]] = None,
+    cancel: Optional[Callable[[H], None]] = None,
+) -> T:
+    """Call `send` guarded by the global and `user_breaker` breakers, retrying transient failures.
+
+    `send(http)` performs the request, on the default connection when `http`
+    is None. When `new_http`/`cancel` are given and GMAIL_HEDGE_AFTER_SECONDS
+    is set, slow attempts are hedged with a second request on a connection of
+    its own.
+
+    Breakers are checked once and told the outcome once per call, after
+    retries: a throttled user trips only their own breaker, while 5xx and
+    connection failures also count toward the global one.
+    """
+    breakers = [global_breaker] + ([user_breaker] if user_breaker else [])
+    allowed = []
+    for breaker in breakers:
+        if not breaker.allow():
+            for taken in allowed:
+                taken.release()
+            raise CircuitOpenError(f"Gmail circuit '{breaker.name}' is open")
+        allowed.append(breaker)
+
+    hedge_after = settings.GMAIL_HEDGE_AFTER_SECONDS
+    attempt = 0
+    while True:
+        try:
+            if new_http is not None and cancel is not None and hedge_after > 0:
+                result = _send_hedged(send, new_http, cancel, hedge_after)
+            else:
+                result = send(None)
+        except Exception as e:
+            retry_after = retry_after_seconds(e)
+            # Gmail asked for a longer pause than we are willing to block for:
+            # give up now rather than retry early and burn the user's quota
+            waits_too_long = retry_after is not None and retry_after > settings.GMAIL_BACKOFF_MAX_SECONDS
+            if is_retryable(e) and not waits_too_long and attempt < settings.GMAIL_MAX_RETRIES:
+                time.sleep(backoff_delay(attempt, retry_after))
+                attempt += 1
+                continue
+
+            for breaker in breakers:
+                if not is_retryable(e):
+                    # A client error means Gmail answered, so it is not an outage
+                    if _status_of(e) is not None:
+                        breaker.record_success()
+                    else:
+                        breaker.release()
+                elif is_quota_error(e) and breaker is global_breaker:
+                    # Gmail is up; only this user is being throttled
+                    breaker.record_success()
+                else:
+                    breaker.record_failure()
+            raise
+
+        for breaker in breakers:
+            breaker.record_success()
+        return result
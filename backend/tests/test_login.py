@@ -0,0 +1,164 @@
+import json
+import time
+
+import pytest
+import requests
+import rsa
+from fastapi.testclient import TestClient
+from google.auth import crypt
+from google.auth import jwt as google_jwt
+
+from backend import google_oauth
+from backend.config import settings
+from backend.main import create_app
+
+CLIENT_ID = "client-123.apps.googleusercontent.com"
+USERINFO = {"sub": "userinfo-sub", "email": "userinfo@example.com", "name": "From UserInfo"}
+
+
+def _response(status_code: int, body: bytes, content_type: str, headers=None) -> requests.Response:
+    resp = requests.Response()
+    resp.status_code = status_code
+    resp._content = body
+    resp.headers["Content-Type"] = content_type
+    resp.headers.update(headers or {})
+    resp.reason = "Bad Gateway" if status_code == 502 else "OK"
+    return resp
+
+
+class _StubSession:
+    """Stands in for the pooled session; answers by URL and records each call."""
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.calls = []
+
+    def _respond(self, url):
+        self.calls.append(url)
+        return self.routes[url]()
+
+    def post(self, url, **kwargs):
+        return self._respond(url)
+
+    def get(self, url, **kwargs):
+        return self._respond(url)
+
+
+@pytest.fixture(scope="module")
+def signing_key():
+    public_key, private_key = rsa.newkeys(1024)
+    signer = crypt.RSASigner.from_string(private_key.save_pkcs1().decode(), key_id="test-key")
+    return signer, {"test-key": public_key.save_pkcs1().decode()}
+
+
+@pytest.fixture
+def google(monkeypatch, signing_key):
+    """Stub Google's token, certs and UserInfo endpoints behind _http_session()."""
+    signer, certs = signing_key
+    monkeypatch.setattr(settings, "GOOGLE_CLIENT_ID", CLIENT_ID)
+    monkeypatch.setattr(google_oauth, "_certs_cache", (0.0, {}))
+    state = {"claims": {}}
+
+    def id_token(**overrides):
+        now = int(time.time())
+        claims = {
+            "iss": "https://accounts.google.com",
+            "aud": CLIENT_ID,
+            "sub": "google-sub",
+            "email": "user@example.com",
+            "name": "From ID Token",
+            "iat": now,
+            "exp": now + 3600,
+        }
+        claims.update(overrides)
+        return google_jwt.encode(signer, claims).decode()
+
+    def token_endpoint():
+        body = {"access_token": "access", "expires_in": 3600, "id_token": id_token(**state["claims"])}
+        return _response(200, json.dumps(body).encode(), "application/json")
+
+    session = _StubSession({
+        google_oauth.GOOGLE_TOKEN_URI: token_endpoint,
+        google_oauth.GOOGLE_CERTS_URI: lambda: _response(
+            200, json.dumps(certs).encode(), "application/json", {"Cache-Control": "public, max-age=3600"}
+        ),
+        google_oauth.GOOGLE_USERINFO_URI: lambda: _response(200, json.dumps(USERINFO).encode(), "application/json"),
+    })
+    monkeypatch.setattr(google_oauth, "_http_session", lambda: session)
+    session.id_token = id_token
+    session.state = state
+    return session
+
+
+@pytest.fixture
+def stub_token_endpoint(monkeypatch):
+    def install(status_code, body, content_type):
+        session = _StubSession({google_oauth.GOOGLE_TOKEN_URI: lambda: _response(status_code, body, content_type)})
+        monkeypatch.setattr(google_oauth, "_http_session", lambda: session)
+    return install
+
+
+def test_pooled_session_is_shared():
+    session = google_oauth._http_session()
+    assert session is google_oauth._http_session()
+    assert session.get_adapter("https://oauth2.googleapis.com")._pool_maxsize == settings.GOOGLE_HTTP_POOL_SIZE
+
+
+def test_id_token_verifies_against_certs(google):
+    claims = google_oauth.verify_id_token(google.id_token())
+    assert claims["sub"] == "google-sub"
+    assert claims["email"] == "user@example.com"
+
+
+def test_certs_cached_for_max_age(google):
+    google_oauth.verify_id_token(google.id_token())
+    expires_at, _ = google_oauth._certs_cache
+    assert expires_at == pytest.approx(time.monotonic() + 3600, abs=5)
+
+
+@pytest.mark.parametrize("claims", [{"aud": "someone-else"}, {"iss": "https://evil.example.com"}])
+def test_unverifiable_id_token_falls_back_to_userinfo(google, claims):
+    google.state["claims"] = claims
+    creds = google_oauth.exchange_code_for_tokens("code")
+    with pytest.raises(ValueError):
+        google_oauth.verify_id_token(creds.id_token)
+
+    assert google_oauth.get_profile(creds) == USERINFO
+    assert google.calls[-1] == google_oauth.GOOGLE_USERINFO_URI
+
+
+def test_logins_within_max_age_fetch_certs_once(google, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with TestClient(create_app()) as client:
+        for _ in range(2):
+            resp = client.post("/api/auth/google/login", json={"code": "abc"})
+            assert resp.status_code == 200
+            assert resp.json()["user"]["name"] == "From ID Token"
+
+    assert google.calls.count(google_oauth.GOOGLE_TOKEN_URI) == 2
+    assert google.calls.count(google_oauth.GOOGLE_CERTS_URI) == 1
+    assert google_oauth.GOOGLE_USERINFO_URI not in google.calls
+
+
+def test_exchange_reports_non_json_error(stub_token_endpoint):
+    stub_token_endpoint(502, b"<html>Bad Gateway</html>", "text/html")
+    with pytest.raises(Exception, match="Token exchange failed: 502 Bad Gateway"):
+        google_oauth.exchange_code_for_tokens("code")
+
+
+def test_exchange_reports_oauth_error(stub_token_endpoint):
+    stub_token_endpoint(400, b'{"error": "invalid_grant", "error_description": "Bad Request"}', "application/json")
+    with pytest.raises(Exception, match="Token exchange failed: Bad Request"):
+        google_oauth.exchange_code_for_tokens("code")
+
+
+def test_failed_login_is_recorded(stub_token_endpoint, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("backend.main.login_metrics", google_oauth.LatencyMetrics())
+    stub_token_endpoint(502, b"<html>Bad Gateway</html>", "text/html")
+
+    with TestClient(create_app()) as client:
+        resp = client.post("/api/auth/google/login", json={"code": "abc"})
+        assert resp.status_code == 400
+        assert "502 Bad Gateway" in resp.json()["detail"]
+        assert client.get("/metrics/login").json()["total"]["count"] == 1
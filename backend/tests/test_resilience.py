@@ -0,0 +1,256 @@
+"""Fault-injection tests for the Gmail resilience layer against a local fake Gmail server."""
+import json
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from fastapi.testclient import TestClient
+from googleapiclient.errors import HttpError
+
+from backend import resilience
+from backend.auth import create_access_token
+from backend.config import settings
+from backend.gmail_service import GmailService
+from backend.google_oauth import build_credentials
+from backend.main import _last_listings, create_app
+
+MESSAGE = {
+    "id": "m1",
+    "threadId": "t1",
+    "labelIds": ["UNREAD"],
+    "snippet": "hello",
+    "internalDate": "1700000000000",
+    "payload": {"headers": [{"name": "Subject", "value": "Hi"}, {"name": "From", "value": "a@example.com"}]},
+}
+
+
+class FakeGmail:
+    """Serves canned Gmail responses; queued faults are consumed one request at a time."""
+
+    def __init__(self):
+        self.faults = []  # (status, headers, body, delay)
+        self.requests = []
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.down = False
+
+    def fail_next(self, count=1, status=503, headers=None, body=b"{}", delay=0.0):
+        self.faults.extend([(status, headers or {}, body, delay)] * count)
+
+    def next_response(self, path):
+        with self.lock:
+            self.requests.append(path)
+            if self.faults:
+                return self.faults.pop(0)
+        if self.down:
+            return 503, {}, b"{}", 0.0
+        if path.split("?")[0].endswith("/messages"):
+            body = {"messages": [{"id": "m1", "threadId": "t1"}]}
+        else:
+            body = MESSAGE
+        return 200, {}, json.dumps(body).encode(), 0.0
+
+
+@pytest.fixture
+def fake_gmail(monkeypatch):
+    fake = FakeGmail()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, so connection reuse is observable
+
+        def setup(self):
+            super().setup()
+            with fake.lock:
+                fake.connections += 1
+
+        def do_GET(self):
+            status, headers, body, delay = fake.next_response(self.path)
+            time.sleep(delay)
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.handle_error = lambda *args: None  # cancelled hedges hang up mid-response
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+
+    monkeypatch.setattr(settings, "GMAIL_API_ENDPOINT", f"http://127.0.0.1:{server.server_port}/")
+    monkeypatch.setattr(settings, "GMAIL_TIMEOUT_SECONDS", 5.0)
+    monkeypatch.setattr(settings, "GMAIL_MAX_RETRIES", 3)
+    monkeypatch.setattr(settings, "GMAIL_BACKOFF_BASE_SECONDS", 0.001)
+    monkeypatch.setattr(settings, "GMAIL_USER_BREAKER_FAILURES", 2)
+    monkeypatch.setattr(settings, "GMAIL_BREAKER_RESET_SECONDS", 0.2)
+    monkeypatch.setattr(settings, "GMAIL_HEDGE_AFTER_SECONDS", 0.0)
+    monkeypatch.setattr(resilience, "global_breaker", resilience.CircuitBreaker("global", 20, 0.2))
+    monkeypatch.setattr(resilience, "_user_breakers", {})
+    yield fake
+    server.shutdown()
+    server.server_close()
+
+
+def _gmail(user_key="u1"):
+    return GmailService(build_credentials("token", None), user_key=user_key)
+
+
+def _message_requests(fake):
+    return [p for p in fake.requests if "/messages/" in p]
+
+
+def test_503_then_success_is_retried(fake_gmail):
+    fake_gmail.fail_next(1, status=503)
+    assert _gmail().get_email_by_id("m1")["id"] == "m1"
+    assert len(_message_requests(fake_gmail)) == 2
+
+
+def test_retry_after_is_respected(fake_gmail, monkeypatch):
+    delays = []
+    backoff_delay = resilience.backoff_delay
+    monkeypatch.setattr(resilience, "backoff_delay", lambda *args: delays.append(backoff_delay(*args)) or 0.0)
+    fake_gmail.fail_next(1, status=429, headers={"Retry-After": "2"})
+
+    assert _gmail().get_email_by_id("m1")["id"] == "m1"
+    assert delays == [pytest.approx(2.0)]
+    assert backoff_delay(0, retry_after=3) >= 3
+
+
+def test_retry_after_beyond_backoff_cap_is_not_retried(fake_gmail, monkeypatch):
+    monkeypatch.setattr(settings, "GMAIL_BACKOFF_MAX_SECONDS", 8.0)
+    monkeypatch.setattr(settings, "GMAIL_USER_BREAKER_FAILURES", 1)
+    backoff_delay = resilience.backoff_delay
+    monkeypatch.setattr(resilience, "backoff_delay", lambda *args: pytest.fail("retried despite Retry-After"))
+    fake_gmail.fail_next(1, status=429, headers={"Retry-After": "30"})
+
+    with pytest.raises(HttpError):
+        _gmail().get_email_by_id("m1")
+    assert len(_message_requests(fake_gmail)) == 1
+    assert resilience.get_breaker("u1").state == "open"
+    assert backoff_delay(0, retry_after=30) >= 30
+
+
+def test_403_rate_limit_is_retried(fake_gmail):
+    body = json.dumps({"error": {"code": 403, "errors": [{"reason": "userRateLimitExceeded"}]}}).encode()
+    fake_gmail.fail_next(1, status=403, body=body)
+    assert _gmail().get_email_by_id("m1")["id"] == "m1"
+    assert len(_message_requests(fake_gmail)) == 2
+
+
+@pytest.mark.parametrize("status", [403, 404])
+def test_client_errors_are_not_retried(fake_gmail, status):
+    fake_gmail.fail_next(1, status=status)
+    with pytest.raises(HttpError):
+        _gmail().get_email_by_id("m1")
+    assert len(_message_requests(fake_gmail)) == 1
+
+
+def test_user_breaker_opens_then_allows_one_trial(fake_gmail, monkeypatch):
+    monkeypatch.setattr(settings, "GMAIL_MAX_RETRIES", 0)
+    fake_gmail.down = True
+    gmail = _gmail()
+    for _ in range(settings.GMAIL_USER_BREAKER_FAILURES):
+        with pytest.raises(HttpError):
+            gmail.get_email_by_id("m1")
+
+    sent = len(fake_gmail.requests)
+    with pytest.raises(resilience.CircuitOpenError):
+        gmail.get_email_by_id("m1")
+    assert len(fake_gmail.requests) == sent
+
+    time.sleep(settings.GMAIL_BREAKER_RESET_SECONDS)
+    fake_gmail.down = False
+    fake_gmail.fail_next(1, status=200, body=json.dumps(MESSAGE).encode(), delay=0.3)
+    trial = threading.Thread(target=gmail.get_email_by_id, args=("m1",))
+    trial.start()
+    time.sleep(0.1)
+    with pytest.raises(resilience.CircuitOpenError):
+        gmail.get_email_by_id("m1")
+    trial.join()
+    assert resilience.get_breaker("u1").state == "closed"
+
+
+def test_throttled_user_does_not_open_global_breaker(fake_gmail, monkeypatch):
+    monkeypatch.setattr(settings, "GMAIL_MAX_RETRIES", 3)
+    monkeypatch.setattr(resilience, "global_breaker", resilience.CircuitBreaker("global", 2, 60))
+    fake_gmail.fail_next(40, status=429, headers={"Retry-After": "0"})
+
+    for _ in range(5):
+        with pytest.raises((HttpError, resilience.CircuitOpenError)):
+            _gmail("throttled").get_email_by_id("m1")
+    assert resilience.global_breaker.state == "closed"
+    assert resilience.get_breaker("throttled").state == "open"
+
+
+def test_slow_primary_is_hedged(fake_gmail, monkeypatch):
+    monkeypatch.setattr(settings, "GMAIL_HEDGE_AFTER_SECONDS", 0.05)
+    fake_gmail.fail_next(1, status=200, body=json.dumps(MESSAGE).encode(), delay=2.0)
+
+    started = time.perf_counter()
+    assert _gmail().get_email_by_id("m1")["id"] == "m1"
+    assert time.perf_counter() - started < 1.0
+    assert len(_message_requests(fake_gmail)) == 2
+
+
+def test_hedged_calls_reuse_keep_alive_connection(fake_gmail, monkeypatch):
+    monkeypatch.setattr(settings, "GMAIL_HEDGE_AFTER_SECONDS", 0.5)
+    gmail = _gmail()
+    for _ in range(5):
+        assert gmail.get_email_by_id("m1")["id"] == "m1"
+    assert len(_message_requests(fake_gmail)) == 5
+    assert fake_gmail.connections == 1
+
+
+@pytest.fixture
+def client(fake_gmail, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(settings, "GMAIL_MAX_RETRIES", 0)
+    _last_listings.clear()
+    with TestClient(create_app()) as client:
+        conn = sqlite3.connect("trackmate.db")
+        conn.execute(
+            "INSERT INTO users (id, google_id, email, name, picture_url, access_token, refresh_token) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            ("u1", "g1", "user@example.com", "User", "", "token", None),
+        )
+        conn.commit()
+        conn.close()
+        client.headers["Authorization"] = f"Bearer {create_access_token({'sub': 'u1'})}"
+        yield client
+    _last_listings.clear()
+
+
+def test_listing_served_stale_when_gmail_down(client, fake_gmail):
+    fresh = client.get("/api/emails/unread")
+    assert fresh.status_code == 200
+    assert "X-Data-Stale" not in fresh.headers
+
+    fake_gmail.down = True
+    stale = client.get("/api/emails/unread")
+    assert stale.status_code == 200
+    assert stale.json() == fresh.json()
+    assert stale.headers["X-Data-Stale"] == "true"
+    assert stale.headers["Warning"].startswith("110")
+    assert stale.headers["X-Data-Fetched-At"].endswith("+00:00")
+
+
+def test_listing_too_old_is_not_served(client, fake_gmail, monkeypatch):
+    assert client.get("/api/emails/unread").status_code == 200
+    monkeypatch.setattr(settings, "GMAIL_STALE_MAX_SECONDS", 0)
+    fake_gmail.down = True
+    assert client.get("/api/emails/unread").status_code == 503
+
+
+def test_listing_without_cache_is_503(client, fake_gmail):
+    fake_gmail.down = True
+    assert client.get("/api/emails/requires-attention").status_code == 503
+
+
+def test_message_details_503_when_gmail_down(client, fake_gmail):
+    fake_gmail.down = True
+    assert client.get("/api/emails/m1").status_code == 503
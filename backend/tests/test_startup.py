@@ -0,0 +1,54 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+# Importing the app must stay cheap: worker boot and test collection pay it.
+IMPORT_BUDGET_SECONDS = 1.0
+HEAVY_MODULES = ("google", "googleapiclient", "google_auth_oauthlib", "google_auth_httplib2", "requests", "httplib2")
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import backend.main
+elapsed = time.perf_counter() - started
+heavy = sorted(m for m in sys.modules if m.split(".")[0] in {heavy!r})
+print(json.dumps({{"elapsed": elapsed, "heavy": heavy}}))
+"""
+
+
+def _import_main_in_subprocess(cwd: Path) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(heavy=HEAVY_MODULES)],
+        cwd=cwd,
+        env={"PYTHONPATH": str(REPO_ROOT)},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def test_import_loads_no_google_clients(tmp_path):
+    result = _import_main_in_subprocess(tmp_path)
+    assert result["heavy"] == []
+
+
+def test_import_within_budget(tmp_path):
+    result = _import_main_in_subprocess(tmp_path)
+    assert result["elapsed"] < IMPORT_BUDGET_SECONDS, f"import took {result['elapsed']:.3f}s"
+
+
+def test_init_db_runs_on_startup_not_import(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    from backend.main import create_app
+
+    app = create_app()
+    assert not (tmp_path / "trackmate.db").exists()
+    with TestClient(app) as client:
+        assert (tmp_path / "trackmate.db").exists()
+        assert client.get("/health").json() == {"status": "ok"}